@@ -3,24 +3,274 @@
 # Supports CSV, JSON, Excel, and Parquet file formats
 
 from mcp.server.fastmcp import FastMCP
-from typing import Any
-import httpx
 import json
-import mcp
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 import duckdb
+import sqlglot
+from sqlglot import exp
 import polars as pl
-import gc
-import pandas as pd
-import pyarrow
-import pydantic
-from pydantic import BaseModel, Field
+from pydantic import BaseModel
 from typing import Dict
 
 # Initialize MCP server and in-memory DuckDB connection
 mcp = FastMCP("file_query_mcp")
 con = duckdb.connect(database=':memory:')  # In-memory database for fast querying
 
+# Reuse cached Parquet metadata across queries. DuckDB already scans with one thread per
+# core and uses up to 80% of RAM; FQ_MCP_THREADS and FQ_MCP_MEMORY_LIMIT override that
+con.execute("SET parquet_metadata_cache = true")
+try:
+    con.execute(f"PRAGMA threads={int(os.environ['FQ_MCP_THREADS'])}")
+except (KeyError, ValueError, duckdb.Error):
+    pass  # Unset or invalid: keep DuckDB's default
+if os.environ.get("FQ_MCP_MEMORY_LIMIT"):
+    con.execute(f"PRAGMA memory_limit='{os.environ['FQ_MCP_MEMORY_LIMIT']}'")
+
+# Supported data file extensions (matched case-insensitively)
+_EXTS = frozenset({'.csv', '.json', '.xlsx', '.parquet'})
+
+# Opt-in columnar cache: CSVs are converted once to a sibling <file>.cache.parquet
+_CSV_CACHE = os.environ.get("FQ_MCP_CSV_CACHE") == "1"
+_CACHE_SUFFIX = ".cache.parquet"
+
+# Translation table used to turn file names into table names
+_TBL = str.maketrans('.-', '__')
+
+# Maximum number of result rows returned by query_files and the batch size used to fetch them
+_MAX_ROWS = int(os.environ.get("FQ_MCP_MAX_ROWS", "10000"))
+_BATCH_ROWS = 10_000
+
+# Number of leading rows the descriptive statistics are computed over
+_SUMMARIZE_ROWS = 1_000_000
+
+# Supported schema override type names and their DuckDB equivalents
+_DUCKDB_DTYPE_MAP = {
+    "int": "BIGINT",
+    "float": "DOUBLE",
+    "str": "VARCHAR",
+    "string": "VARCHAR",
+    "bool": "BOOLEAN",
+    "date": "DATE",
+    "datetime": "TIMESTAMP",
+}
+
+# In-process copies of the JSON files, reloaded only when the file's mtime changes
+_files_cache = {"mtime": None, "data": None}
+_schema_cache = {"mtime": None, "data": None}
+
+def _load_json(path: str, cache: dict) -> dict:
+    """Return the cached contents of a JSON file, re-reading it only if it changed on disk"""
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    if cache["mtime"] != mtime:
+        with open(path, "r") as f:
+            cache["data"] = json.load(f)
+        cache["mtime"] = mtime
+    return cache["data"]
+
+def _save_json(path: str, cache: dict, data: dict) -> None:
+    """Atomically write a JSON file and refresh its in-process copy"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+    cache["data"] = dict(data)
+    cache["mtime"] = os.stat(path).st_mtime_ns
+
+def _load_catalog() -> dict:
+    # Shared cache, not a copy: query_files calls this on every query and nothing mutates it
+    return _load_json("data_files.json", _files_cache)
+
+def _save_catalog(data_files: dict) -> None:
+    _save_json("data_files.json", _files_cache, data_files)
+
+def _load_schemas() -> dict:
+    # A copy, because list_file_schema adds entries before deciding what to save
+    return dict(_load_json("schema_descriptions.json", _schema_cache))
+
+def _save_schemas(schema_descriptions: dict) -> None:
+    _save_json("schema_descriptions.json", _schema_cache, schema_descriptions)
+
+# File name/path -> table name lookup for query_files, rebuilt when the catalog changes
+_name_index = {"mtime": None, "pattern": None, "tables": {}, "paths": set()}
+
+def _load_name_index() -> dict:
+    """Return the compiled file name/path pattern for the current catalog"""
+    data_files = _load_catalog()
+    if _name_index["mtime"] != _files_cache["mtime"] or _name_index["pattern"] is None:
+        tables = {}
+        paths = set()
+        for file_name, info in data_files.items():
+            if not isinstance(info, dict):
+                continue
+            tables[file_name] = info["table_name"]
+            tables.setdefault(info["path"], info["table_name"])
+            paths.add(info["path"])
+        # Longest names first so a name never shadows a longer one it prefixes
+        names = sorted(tables, key=len, reverse=True)
+        alternation = "|".join(re.escape(name) for name in names) or r"(?!)"
+        # A name may be double-quoted, and followed by ".column" (or ".*") when it
+        # qualifies a column
+        _name_index["pattern"] = re.compile(
+            rf"(?<![\w./\\'\"-])(\")?(?P<name>{alternation})(?(1)\")"
+            rf"(?:(?![\w.\"-])|(?=\.(?:\w+|\*)(?![\w.\"-])))"
+        )
+        _name_index["tables"] = tables
+        _name_index["paths"] = paths
+        _name_index["mtime"] = _files_cache["mtime"]
+    return _name_index
+
+@lru_cache(maxsize=64)
+def _rewrite_query(raw_query: str, catalog_mtime: int) -> tuple[str, tuple]:
+    """Replace catalogued file names/paths used as tables with their DuckDB table names
+
+    The query is parsed with sqlglot and matching Table nodes and column qualifiers
+    (e.g. sales.csv.id) are renamed, which also handles quoted names and aliases.
+    Queries sqlglot cannot parse as a single statement (e.g. unquoted paths or
+    hyphenated names) fall back to the regex pass.
+    Returns the rewritten query and the catalogued names it referenced. Results are
+    cached per catalog mtime, so repeated queries skip parsing entirely.
+    """
+    name_index = _load_name_index()
+    tables = name_index["tables"]
+    used_names = []
+    
+    try:
+        statements = sqlglot.parse(raw_query, read='duckdb')
+    except (sqlglot.errors.SqlglotError, RecursionError):
+        # RecursionError: sqlglot's parser gives up on deeply nested expressions
+        statements = []
+    
+    if len(statements) == 1 and statements[0] is not None:
+        def rename(node):
+            if isinstance(node, exp.Table):
+                name = ".".join(part.name for part in node.parts)
+                if name in tables:
+                    used_names.append(name)
+                    node.set("this", exp.to_identifier(tables[name], quoted=True))
+                    node.set("db", None)
+                    node.set("catalog", None)
+            elif isinstance(node, exp.Column) and node.table:
+                name = ".".join(part.name for part in node.parts[:-1])
+                if name in tables:
+                    used_names.append(name)
+                    node.set("table", exp.to_identifier(tables[name], quoted=True))
+                    node.set("db", None)
+                    node.set("catalog", None)
+            return node
+        tree = statements[0].transform(rename)
+        if used_names:
+            return tree.sql(dialect='duckdb'), tuple(used_names)
+    
+    def substitute(match):
+        used_names.append(match.group("name"))
+        return _sql_identifier(tables[match.group("name")])
+    query = name_index["pattern"].sub(substitute, raw_query)
+    return query, tuple(used_names)
+
+def _iter_files(root: str):
+    """Yield (name, path) for every regular file below root without extra stat calls"""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file():
+                        yield entry.name, entry.path
+        except OSError:
+            # Unreadable or missing directories are skipped, as os.walk does
+            continue
+
+def _materialize_cache(path: str) -> str:
+    """Convert a CSV to a sibling Parquet cache (if missing or stale) and return its path"""
+    cache_path = path + _CACHE_SUFFIX
+    if not os.path.exists(cache_path) or os.path.getmtime(cache_path) < os.path.getmtime(path):
+        # Convert with DuckDB's own CSV reader so cached and uncached schemas match, and
+        # stream into a temporary file so a failed conversion never leaves a valid-looking cache
+        tmp_path = cache_path + ".tmp"
+        cursor = con.cursor()  # own connection: this runs in list_file_schema's worker threads
+        try:
+            cursor.execute(
+                f"COPY (SELECT * FROM read_csv_auto({_sql_string(path)})) "
+                f"TO {_sql_string(tmp_path)} (FORMAT parquet, COMPRESSION zstd)"
+            )
+            os.replace(tmp_path, cache_path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            cursor.close()
+    return cache_path
+
+def _sql_string(value: str) -> str:
+    """Quote a Python string as a SQL string literal (e.g. a file path)"""
+    return "'" + value.replace("'", "''") + "'"
+
+def _sql_identifier(name: str) -> str:
+    """Quote a Python string as a SQL identifier (e.g. a column name)"""
+    return '"' + name.replace('"', '""') + '"'
+
+# Arrow tables registered with DuckDB, kept so they can be unregistered explicitly
+_registered = {}
+
+def _register_arrow(table_name: str, df: pl.DataFrame) -> None:
+    """Register a Polars frame with DuckDB as a (zero-copy) Arrow table"""
+    arrow_tbl = df.to_arrow()
+    con.register(table_name, arrow_tbl)
+    _registered[table_name] = arrow_tbl
+
+def _attach_table(table_name: str, source, projection: str = "*") -> None:
+    """Expose a file to DuckDB under table_name, keeping a single copy of its data
+
+    source is either a DuckDB reader expression, which becomes a lazy view, or a
+    Polars DataFrame (xlsx), which is registered as an Arrow table.
+    """
+    if isinstance(source, str):
+        # A previously registered Arrow table would shadow the view and keep its data alive
+        if _registered.pop(table_name, None) is not None:
+            con.unregister(table_name)
+        con.execute(f"CREATE OR REPLACE VIEW {_sql_identifier(table_name)} AS SELECT {projection} FROM {source}")
+    else:
+        _register_arrow(table_name, source)
+
+def _format_rows(columns: list, rows: list) -> str:
+    """Render result rows as a plain-text table with right-aligned columns"""
+    cells = [["NULL" if value is None else str(value) for value in row] for row in rows]
+    widths = [max([len(col)] + [len(row[i]) for row in cells]) for i, col in enumerate(columns)]
+    lines = ["  ".join(col.rjust(width) for col, width in zip(columns, widths))]
+    lines += ["  ".join(value.rjust(width) for value, width in zip(row, widths)) for row in cells]
+    return "\n".join(lines)
+
+def _fetch_formatted(sql: str) -> str:
+    """Execute a small query and return its result formatted as text"""
+    cursor = con.execute(sql)
+    columns = [col[0] for col in cursor.description]
+    return _format_rows(columns, cursor.fetchall())
+
+def _describe_table(table_name: str) -> tuple[str, str, str]:
+    """Return schema, descriptive statistics and top 5 rows of a DuckDB table"""
+    return _describe_relation(_sql_identifier(table_name))
+
+def _describe_relation(relation: str) -> tuple[str, str, str]:
+    """Return schema, descriptive statistics and top 5 rows of a table or (subquery)
+
+    Statistics only cover the first _SUMMARIZE_ROWS rows so large files are not
+    scanned in full; run "SUMMARIZE <file name>" through query_files for exact ones.
+    """
+    schema = _fetch_formatted(f"DESCRIBE SELECT * FROM {relation}")
+    stats = _fetch_formatted(f"SUMMARIZE SELECT * FROM {relation} LIMIT {_SUMMARIZE_ROWS}")
+    preview = _fetch_formatted(f"SELECT * FROM {relation} LIMIT 5")
+    return schema, stats, preview
+
 #--------------Input Classes-------------------
 # Pydantic models for type validation and structure
 
@@ -55,42 +305,66 @@ def list_data_files(path: str) -> str:
     """
     data_files = {}
     if os.path.exists("schema_descriptions.json"):
-        with open("schema_descriptions.json", "w") as f:
-            f.write("{}")  # Reset schema cache
+        _save_schemas({})  # Reset schema cache
     
     # Walk through directory tree to find data files
-    for root, dirs, files in os.walk(path):
-        for file in files:
-            # Check for supported file extensions
-            if file.endswith(('.csv', '.json', '.xlsx', '.parquet')):
-                # Create sanitized table name (replace special chars with underscores)
-                file_name = file.replace('.', '_').replace('-', '_')
-                file_table_name = f"_{file_name}"
-                
-                # Store file metadata
-                data_files[file] = {
-                    "path": os.path.join(root, file), 
-                    "table_name": file_table_name
-                }
+    for file, file_path in _iter_files(path):
+        # Check for supported file extensions, skipping our own Parquet caches
+        if os.path.splitext(file)[1].lower() in _EXTS and not file.endswith(_CACHE_SUFFIX):
+            # Create sanitized table name (replace special chars with underscores)
+            file_name = file.translate(_TBL)
+            file_table_name = f"_{file_name}"
+            
+            # Store file metadata
+            data_files[file] = {
+                "path": file_path, 
+                "table_name": file_table_name
+            }
 
     # Handle case when no files are found
     if not data_files:
-        json.dump({"error": "No data files found"}, open("data_files.json", "w"), indent=4)
+        _save_catalog({"error": "No data files found"})
     else:
         # Save catalog to JSON file for persistence
-        json.dump(data_files, open("data_files.json", "w"), indent=4)
+        _save_catalog(data_files)
 
     # Return user-friendly list of file names
     names_list = list(data_files.keys())
     all_file_names_str = "\n".join(names_list)
     return all_file_names_str
 
+def _load_one(file: str, data_files: dict):
+    """Prepare one catalogued file for DuckDB without touching the connection
+
+    Returns a DuckDB reader expression for natively supported formats, a Polars
+    DataFrame for xlsx, or None for unsupported files. Safe to run in a worker thread.
+    """
+    path = data_files[file]["path"]
+    ext = os.path.splitext(file)[1].lower()
+    if ext == '.csv':
+        if _CSV_CACHE:
+            try:
+                return f"read_parquet({_sql_string(_materialize_cache(path))})"
+            except Exception:
+                pass  # Read the CSV directly when the cache cannot be written
+        return f"read_csv_auto({_sql_string(path)})"
+    elif ext == '.json':
+        return f"read_json_auto({_sql_string(path)})"
+    elif ext == '.parquet':
+        return f"read_parquet({_sql_string(path)})"
+    elif ext == '.xlsx':
+        # DuckDB has no built-in xlsx reader, fall back to Polars (Rust calamine engine)
+        return pl.read_excel(path, engine='calamine')
+    return None
+
 @mcp.tool()
 def list_file_schema(file_names_list: list) -> str:
     """Analyze file schemas and load data into memory for querying
     
     For each file, extracts schema information, descriptive statistics,
     and sample data. Also registers the data with DuckDB for SQL querying.
+    Statistics cover at most the first 1,000,000 rows; run "SUMMARIZE <file name>"
+    with query_files for statistics over the whole file.
     
     Args:
         file_names_list: List of file names to analyze
@@ -113,16 +387,21 @@ def list_file_schema(file_names_list: list) -> str:
     # - Loads data files into DuckDB memory
     # - Creates/updates 'schema_descriptions.json' cache
     # Load existing schema cache if available
-    if os.path.exists("schema_descriptions.json"):
-        with open("schema_descriptions.json", "r") as f:
-            schema_descriptions = json.load(f)
-    else:
-        schema_descriptions = {}
+    schema_descriptions = _load_schemas()
     
     # Load file catalog
-    if os.path.exists("data_files.json"):
-        with open("data_files.json", "r") as f:
-            data_files = json.load(f)
+    data_files = _load_catalog()
+    
+    # Read files whose schema is not cached yet in parallel (Polars and DuckDB release
+    # the GIL); everything touching the shared DuckDB connection stays on this thread
+    pending = [f for f in dict.fromkeys(file_names_list) if f in data_files and f not in schema_descriptions]
+    loads = {}
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(len(pending), os.cpu_count() or 1)) as pool:
+            loads = {file: pool.submit(_load_one, file, data_files) for file in pending}
+    
+    # Descriptions generated by this call, persisted once after the loop
+    described = {}
     
     # Process each requested file
     for file in file_names_list:
@@ -131,45 +410,27 @@ def list_file_schema(file_names_list: list) -> str:
             schema_descriptions[file] = f"File {file} not found.\n"
             continue
             
-        path = data_files[file]["path"]
         table_name = data_files[file]['table_name']
         
         try:
             # Skip if schema already cached
-            if file not in schema_descriptions.keys():
-                # Load file based on extension using Polars
-                if file.endswith('.csv'):
-                    df = pl.read_csv(path)
-                    con.register(table_name, df)
-                elif file.endswith('.json'):
-                    df = pl.read_json(path)
-                    con.register(table_name, df)
-                elif file.endswith('.xlsx'):
-                    df = pl.read_excel(path)
-                    con.register(table_name, df)
-                elif file.endswith('.parquet'):
-                    df = pl.read_parquet(path)
-                    con.register(table_name, df)
-                else:
-                    schema_descriptions["file"] = f"Unsupported file format for {file}.\n"
+            if file in loads and file not in schema_descriptions.keys():
+                source = loads[file].result()
+                if source is None:
+                    schema_descriptions[file] = f"Unsupported file format for {file}.\n"
                     continue
-                
-                # Register dataframe with DuckDB for SQL querying
-                #con.register(table_name, df)
-                
-                # Generate comprehensive schema description
+
+                # Expose file to DuckDB as a lazy view, or register the frame read by Polars
+                _attach_table(table_name, source)
+
+                # Generate comprehensive schema description from DuckDB
+                schema, stats, preview = _describe_table(table_name)
                 schema_descriptions[file] = f"""
-                Schema for {file}:\n{df.schema}\n\n
-                Descriptive statistics for {file}:\n{df.describe()}\n\n
-                Top 5 rows of {file}:\n{df.head(5).to_pandas().to_string()}\n
+                Schema for {file}:\n{schema}\n\n
+                Descriptive statistics for {file}:\n{stats}\n\n
+                Top 5 rows of {file}:\n{preview}\n
                 --- \n"""
-                
-                # Clean up memory
-                del df
-                gc.collect()
-                
-            # Update schema cache
-            json.dump(schema_descriptions, open("schema_descriptions.json", "w"), indent=4)
+                described[file] = schema_descriptions[file]
             
         except Exception as e:
             # Handle file reading errors gracefully
@@ -183,6 +444,10 @@ def list_file_schema(file_names_list: list) -> str:
             except:
                 pass
             
+    # Update schema cache with a single write
+    if described:
+        _save_schemas({**_load_schemas(), **described})
+    
     # Compile output for requested files
     output_string = "\n".join([schema_descriptions[f] for f in file_names_list if f in schema_descriptions.keys()])
     return output_string
@@ -204,14 +469,8 @@ def load_override_schema(schema_json: FileSchemaOverride) -> str:
         int, float, str/string, bool, date, datetime
     """
     # Load file catalog and schema cache
-    if os.path.exists("data_files.json"):
-        with open("data_files.json", "r") as f:
-            data_files = json.load(f)   
-    if os.path.exists("schema_descriptions.json"):
-        with open("schema_descriptions.json", "r") as f:
-            schema_descriptions = json.load(f)
-    else:
-        schema_descriptions = {}
+    data_files = _load_catalog()
+    schema_descriptions = _load_schemas()
     
     # Validate file exists
     if schema_json.file_name not in data_files.keys():
@@ -220,58 +479,63 @@ def load_override_schema(schema_json: FileSchemaOverride) -> str:
     path = data_files[schema_json.file_name]["path"]
     table_name = data_files[schema_json.file_name]['table_name']
     
-    # Convert string type names to Polars data types
-    schema_override = {}
-    for col, dtype in schema_json.schema_override_input.items():
-        if dtype.lower() == "int":
-            schema_override[col] = pl.Int64
-        elif dtype.lower() == "float":
-            schema_override[col] = pl.Float64
-        elif dtype.lower() == "str" or dtype.lower() == "string":
-            schema_override[col] = pl.Utf8
-        elif dtype.lower() == "bool":
-            schema_override[col] = pl.Boolean
-        elif dtype.lower() == "date":
-            schema_override[col] = pl.Date
-        elif dtype.lower() == "datetime":
-            schema_override[col] = pl.Datetime
-        else:
-            return f"Error: Unsupported data type {dtype} for column {col}."
+    # Convert string type names to DuckDB data types
+    override_input = schema_json.schema_override_input
+    try:
+        duckdb_override = {col: _DUCKDB_DTYPE_MAP[dtype.lower()] for col, dtype in override_input.items()}
+    except KeyError:
+        col, dtype = next((c, d) for c, d in override_input.items() if d.lower() not in _DUCKDB_DTYPE_MAP)
+        return f"Error: Unsupported data type {dtype} for column {col}."
     
+    raw_name = None
     try:
+        # Casts applied on top of the readers that cannot take column types
+        casts = ", ".join(
+            f"CAST({_sql_identifier(col)} AS {dtype}) AS {_sql_identifier(col)}"
+            for col, dtype in duckdb_override.items()
+        )
+        projection = f"* REPLACE ({casts})" if casts else "*"
+        
         # Load file with custom schema based on file type
-        if schema_json.file_name.endswith('.csv'):
-            df = pl.read_csv(path, dtypes=schema_override)
-            con.register(table_name, df)
-        elif schema_json.file_name.endswith('.json'):
-            df = pl.read_json(path, dtypes=schema_override)
-            con.register(table_name, df)
-        elif schema_json.file_name.endswith('.xlsx'):
-            df = pl.read_excel(path, dtypes=schema_override)
-            con.register(table_name, df)
-        elif schema_json.file_name.endswith('.parquet'):
-            df = pl.read_parquet(path, dtypes=schema_override)
-            con.register(table_name, df)
+        ext = os.path.splitext(schema_json.file_name)[1].lower()
+        if ext == '.csv':
+            types = ", ".join(f"{_sql_string(col)}: {_sql_string(dtype)}" for col, dtype in duckdb_override.items())
+            source = f"read_csv({_sql_string(path)}, AUTO_DETECT=TRUE, types={{{types}}})"
+            projection = "*"
+        elif ext == '.json':
+            source = f"read_json_auto({_sql_string(path)})"
+        elif ext == '.parquet':
+            source = f"read_parquet({_sql_string(path)})"
+        elif ext == '.xlsx':
+            # DuckDB has no built-in xlsx reader, fall back to Polars (Rust calamine engine).
+            # Overridden columns are read as text and cast by DuckDB, so cells that do not
+            # convert raise an error instead of silently becoming NULL
+            frame = pl.read_excel(path, engine='calamine', schema_overrides={col: pl.String for col in duckdb_override})
+            raw_name = table_name + "_raw"
+            con.register(raw_name, frame.to_arrow())
+            source = _sql_identifier(raw_name)
         else:
             return f"Error: Unsupported file format for {schema_json.file_name}."
         
-        # Register with DuckDB
-        #con.register(table_name, df)
-        
+        # Describe the overridden source before replacing the table, so a bad override
+        # returns an error and leaves the previously loaded table untouched
+        schema, stats, preview = _describe_relation(f"(SELECT {projection} FROM {source})")
+        if raw_name is None:
+            _attach_table(table_name, source, projection)
+        else:
+            # Register the cast result itself, so the text columns are not kept around
+            cast_tbl = con.execute(f"SELECT {projection} FROM {source}").arrow()
+            _attach_table(table_name, pl.from_arrow(cast_tbl))
         
         # Update schema description with override information
         schema_descriptions[schema_json.file_name] = f"""
-        Schema for {schema_json.file_name} with override:\n{df.schema}\n\n
-        Descriptive statistics for {schema_json.file_name}:\n{df.describe()}\n\n
-        Top 5 rows of {schema_json.file_name}:\n{df.head(5).to_pandas().to_string()}\n
+        Schema for {schema_json.file_name} with override:\n{schema}\n\n
+        Descriptive statistics for {schema_json.file_name}:\n{stats}\n\n
+        Top 5 rows of {schema_json.file_name}:\n{preview}\n
         --- \n"""
         
         # Save updated schema cache
-        json.dump(schema_descriptions, open("schema_descriptions.json", "w"), indent=4)
-        
-        # Clean up memory
-        del df
-        gc.collect()
+        _save_schemas(schema_descriptions)
         
         return f"""Successfully loaded {schema_json.file_name} with override schema.
         Here is the schema:\n{schema_descriptions[schema_json.file_name]}
@@ -279,6 +543,9 @@ def load_override_schema(schema_json: FileSchemaOverride) -> str:
         
     except Exception as e:
         return f"Error loading {schema_json.file_name} with override schema: {str(e)}"
+    finally:
+        if raw_name is not None:
+            con.unregister(raw_name)
 
 @mcp.tool()
 def query_files(raw_query: str) -> str:
@@ -294,6 +561,7 @@ def query_files(raw_query: str) -> str:
         **Important:**
         Table names **must exactly match** the full file names, **including file extensions** (e.g., `.csv`, `.parquet`, `.json`).
         use a simple aliasing convention to avoid issues with special characters.
+        Names containing spaces or other special characters can be double-quoted (e.g. `"my sales.csv"`).
 
         Valid:
         `"SELECT * FROM sales_data.csv sd WHERE revenue > 1000"`
@@ -307,41 +575,37 @@ def query_files(raw_query: str) -> str:
 
     
     Returns:
-        String representation of query results or error message
+        String representation of query results (at most FQ_MCP_MAX_ROWS rows, default 10000) or error message
         
     """
     # Translates file names in SQL queries to their corresponding table names
     # and executes the query using DuckDB.
     # Note:
     # File names and paths in queries are automatically converted to table names
-    words = raw_query.split()
+    name_index = _load_name_index()
     
-    # Load file catalog for name translation
-    if os.path.exists("data_files.json"):
-        with open("data_files.json", "r") as f:
-            data_files = json.load(f)
+    # Replace file names and paths with table names
+    query, used_names = _rewrite_query(raw_query, name_index["mtime"])
     
-    # Replace file names and paths with table names in query
-    for file_name in data_files.keys():
-        # Replace direct file name references
-        if file_name in words:
-            raw_query = raw_query.replace(file_name, data_files[file_name]['table_name'])
-            continue
-            
-        # Replace file path references
-        path = data_files[file_name]["path"]
-        if path in words:
-            if not os.path.exists(path):
-                return f"Error: File {path} does not exist."
-            raw_query = raw_query.replace(f"{path}", data_files[file_name]['table_name'])
-            continue
-
-    query = raw_query
+    # Reject catalogued paths that no longer exist on disk
+    for name in used_names:
+        if name in name_index["paths"] and not os.path.exists(name):
+            return f"Error: File {name} does not exist."
     
     try:
-        # Execute query and return results as formatted string
-        result_df = con.execute(query).df()
-        result_str = result_df.to_string()
+        # Fetch the result in batches and stop once the row cap is reached
+        cursor = con.execute(query)
+        columns = [col[0] for col in cursor.description]
+        rows = []
+        while len(rows) <= _MAX_ROWS:
+            batch = cursor.fetchmany(_BATCH_ROWS)
+            if not batch:
+                break
+            rows.extend(batch)
+        
+        result_str = _format_rows(columns, rows[:_MAX_ROWS])
+        if len(rows) > _MAX_ROWS:
+            result_str += f"\n... (output truncated to the first {_MAX_ROWS} rows)"
         return result_str
     except Exception as e:
         return f"Error executing query: {str(e)}"